@@ -208,8 +208,9 @@ class BrokenTrackSim(H5FlowStage):
             d = self.apply_translation(hits, rand_x, rand_y)
             trans_hits = d['trans_hits']
 
-            track_ids = self.reco.find_tracks(trans_hits, hit_drift['z'])
-            new_tracks = self.reco.calc_tracks(trans_hits, hit_drift['z'], track_ids,
+            trans_xyz = self.reco.hit_xyz(trans_hits, hit_drift['z'])
+            track_ids = self.reco.find_tracks(trans_hits, trans_xyz)
+            new_tracks = self.reco.calc_tracks(trans_hits, trans_xyz, track_ids,
                                                self.trajectory_pts,
                                                self.trajectory_dx)
 
@@ -150,7 +150,7 @@ class TimeDeltaRawEventBuilder(RawEventBuilder):
 
         # cluster into events by delta t
         packet_dt = packets['timestamp'][1:] - packets['timestamp'][:-1]
-        event_idx = np.argwhere(np.abs(packet_dt) > self.event_dt).ravel() - 1
+        event_idx = np.flatnonzero(np.abs(packet_dt) > self.event_dt) - 1
         events = np.split(packets, event_idx)
         event_unix_ts = np.split(unix_ts, event_idx)
         if mc_assn is not None:
@@ -205,9 +205,9 @@ class TimeDeltaRawEventBuilder(RawEventBuilder):
         '''
         args = list(args)
         timestamps = event['timestamp'].astype(int)
-        indices = np.argwhere(timestamps > timestamp)
+        indices = np.flatnonzero(timestamps > timestamp)
         if len(indices):
-            idx = np.min(indices)
+            idx = indices[0]
             args.insert(0, event)
             rv = [(arg[:idx], arg[idx:]) for arg in args]
             return tuple(v for vs in rv for v in vs)
@@ -362,7 +362,7 @@ class SymmetricWindowRawEventBuilder(RawEventBuilder):
         event_idx = np.argmax(event_mask, axis=0)
         event_mask = np.any(event_mask, axis=0)
         event_diff = np.diff(event_idx, axis=-1)
-        event_idcs = np.argwhere(event_diff | np.diff(event_mask, axis=-1)).ravel() + 1
+        event_idcs = np.flatnonzero(event_diff | np.diff(event_mask, axis=-1)) + 1
 
         events = np.split(packets, event_idcs)
         event_unix_ts = np.split(unix_ts, event_idcs)
@@ -14,6 +14,14 @@ from module0_flow.reco.charge.raw_event_builder import *
 import module0_flow.util.units as units
 
 
+def _next_prime(n):
+    ''' :returns: smallest prime ``>= n`` '''
+    n = max(int(n), 2)
+    while any(n % i == 0 for i in range(2, int(n ** 0.5) + 1)):
+        n += 1
+    return n
+
+
 class RawEventGenerator(H5FlowGenerator):
     '''
         Low-level event builder - generates packet groups according to the
@@ -94,6 +102,8 @@ class RawEventGenerator(H5FlowGenerator):
         ('id', 'u8'),
     ])
 
+    min_rdcc_nbytes = 64 * 1024 * 1024  # minimum input file chunk cache size [bytes]
+
     def __init__(self, **params):
         super(RawEventGenerator, self).__init__(**params)
 
@@ -117,10 +127,19 @@ class RawEventGenerator(H5FlowGenerator):
         self.event_builder = globals()[self.event_builder_class](**self.event_builder_config)
 
         # set up input file
-        if H5FLOW_MPI:
-            self.input_fh = h5py.File(self.input_filename, 'r', driver='mpio', comm=self.comm)
-        else:
-            self.input_fh = h5py.File(self.input_filename, 'r')
+        self.input_fh = self._open_input_file()
+        packets = self.input_fh['packets']
+        if packets.chunks is not None:
+            # re-open with a chunk cache large enough to hold a full buffer
+            chunk_size = packets.chunks[0]
+            chunk_bytes = chunk_size * packets.dtype.itemsize
+            rdcc_nbytes = max((ceil(self.buffer_size / chunk_size) + 1) * chunk_bytes,
+                              self.min_rdcc_nbytes)
+            rdcc_nslots = _next_prime(10 * ceil(rdcc_nbytes / chunk_bytes))
+            self.input_fh.close()
+            self.input_fh = self._open_input_file(rdcc_nbytes=rdcc_nbytes,
+                                                  rdcc_nslots=rdcc_nslots,
+                                                  rdcc_w0=1.)
         self.packets = self.input_fh['packets']
 
         # set up loop variables
@@ -134,6 +153,11 @@ class RawEventGenerator(H5FlowGenerator):
     def __len__(self):
         return len(self.slices)
 
+    def _open_input_file(self, **kwargs):
+        if H5FLOW_MPI:
+            return h5py.File(self.input_filename, 'r', driver='mpio', comm=self.comm, **kwargs)
+        return h5py.File(self.input_filename, 'r', **kwargs)
+
     def _convert_mc_truth_tracks(self, tracks):
         ''' Apply geometry transformation from edep-sim coordinates to larnd-sim / module0_flow coordinates '''
         tracks_copy = tracks.copy()
@@ -183,6 +207,9 @@ class RawEventGenerator(H5FlowGenerator):
             self.mc_tracks_dtype = self.mc_tracks.dtype
 
         # initialize data objects
+        # (dataset layout and filters are left to h5flow: output files are
+        # written in parallel, which can't use compression filters here, and
+        # bitshuffle would add a plugin requirement for every reader)
         self.data_manager.create_dset(self.raw_event_dset_name, dtype=self.raw_event_dtype)
         self.data_manager.create_dset(self.packets_dset_name, dtype=self.packets_dtype)
         self.data_manager.create_ref(self.raw_event_dset_name, self.packets_dset_name)
@@ -296,11 +323,20 @@ class RawEventGenerator(H5FlowGenerator):
         #         (units.cm / units.us)
 
         # get first timestamp packet from file, without loading the full dataset
-        self.last_unix_ts = np.empty((0,), dtype=self.packets_dtype)
-        for p in self.packets:
-            if p['packet_type'] == 4:
-                self.last_unix_ts = p
-                break
+        self.last_unix_ts = np.zeros((), dtype=self.packets_dtype)
+        if self.rank == 0:
+            # scan packet types in chunk-aligned blocks, stop at first match
+            step = self.buffer_size
+            if self.packets.chunks is not None:
+                chunk_size = self.packets.chunks[0]
+                step = max(step // chunk_size, 1) * chunk_size
+            for start in range(0, len(self.packets), step):
+                is_unix_ts = self.packets[start:start + step, 'packet_type'] == 4
+                if np.any(is_unix_ts):
+                    self.last_unix_ts = self.packets[start + np.argmax(is_unix_ts)]
+                    break
+        if H5FLOW_MPI:
+            self.last_unix_ts = self.comm.bcast(self.last_unix_ts, root=0)
 
     def finish(self):
         super(RawEventGenerator, self).finish()
@@ -327,32 +363,35 @@ class RawEventGenerator(H5FlowGenerator):
         else:
             mc_assn = None
 
-        mask = (block['valid_parity'].astype(bool) & (block['packet_type'] == 0))  # data packets
-        mask = mask | (block['packet_type'] == 4)  # timestamp packets
-        mask = mask | (block['packet_type'] == 7)  # external trigger packets
-        mask = mask | (block['packet_type'] == 6)  # sync packets
+        # only pull out the packet fields needed to select packets
+        packet_type = np.ascontiguousarray(block['packet_type'])
+        valid_parity = np.ascontiguousarray(block['valid_parity'])
+
+        mask = ((packet_type == 4) | (packet_type == 6) | (packet_type == 7)  # timestamp, sync, and external trigger packets
+                | ((packet_type == 0) & valid_parity.astype(bool)))  # data packets
 
-        packet_buffer = np.copy(block[mask])
+        packet_buffer = block[mask]
         self.pass_last_unix_ts(packet_buffer)
-        packet_buffer = np.insert(packet_buffer, [0], self.last_unix_ts)
         if self.is_mc:
             mc_assn = mc_assn[mask]
 
-        # find unix timestamp groups
-        ts_mask = packet_buffer['packet_type'] == 4
-        ts_grps = np.split(packet_buffer, np.argwhere(ts_mask).ravel())
-        unix_ts_grps = [np.full(len(ts_grp[1:]), ts_grp[0], dtype=packet_buffer.dtype) for ts_grp in ts_grps if len(ts_grp)]
-        unix_ts = np.concatenate(unix_ts_grps, axis=0) \
-            if len(unix_ts_grps) else np.empty((0,), dtype=packet_buffer.dtype)
+        # find unix timestamp groups, packets before the first timestamp
+        # packet belong to the last timestamp packet of the previous block
+        ts_mask = packet_type[mask] == 4
+        ts_idx = np.flatnonzero(ts_mask)
+        ts_grp_len = np.diff(np.r_[-1, ts_idx, len(packet_buffer)]) - 1  # excludes timestamp packet
+        ts_grp_unix_ts = np.concatenate((np.expand_dims(self.last_unix_ts, 0), packet_buffer[ts_idx]))
+        unix_ts = np.repeat(ts_grp_unix_ts, ts_grp_len)
+        self.last_unix_ts = packet_buffer[ts_idx[-1]] if len(ts_idx) else self.last_unix_ts
         packet_buffer = packet_buffer[~ts_mask]
         if self.is_mc:
-            mc_assn = mc_assn[~ts_mask[1:]]
-        packet_buffer['timestamp'] = packet_buffer['timestamp'].astype(int) % (2**31)  # ignore 32nd bit from pacman triggers
-        self.last_unix_ts = unix_ts[-1] if len(unix_ts) else self.last_unix_ts
+            mc_assn = mc_assn[~ts_mask]
+        timestamp = packet_buffer['timestamp'].astype(int) % (2**31)  # ignore 32nd bit from pacman triggers
+        packet_buffer['timestamp'] = timestamp
 
         if self.sync_noise_cut_enabled and not self.is_mc:
             # remove all packets that occur before the cut
-            sync_noise_mask = (packet_buffer['timestamp'] > self.sync_noise_cut[0]) & (packet_buffer['timestamp'] < self.sync_noise_cut[1])
+            sync_noise_mask = (timestamp > self.sync_noise_cut[0]) & (timestamp < self.sync_noise_cut[1])
             packet_buffer = packet_buffer[sync_noise_mask]
             unix_ts = unix_ts[sync_noise_mask]
             if self.is_mc:
@@ -367,39 +406,35 @@ class RawEventGenerator(H5FlowGenerator):
             event_mc_assn = None
 
         # apply nhit cut
-        nhit_filtered = list(filter(lambda x: len(x[0]) >= self.nhit_cut, zip(events, event_unix_ts)))
+        event_nhit = np.fromiter((len(ev) for ev in events), dtype=int, count=len(events))
+        event_idx = np.flatnonzero(event_nhit >= self.nhit_cut)
+        events = [events[i] for i in event_idx]
+        event_unix_ts = [event_unix_ts[i] for i in event_idx]
         if self.is_mc:
-            mc_assn_filtered = list(filter(lambda x: len(x) >= self.nhit_cut, event_mc_assn))
-
-        if len(nhit_filtered):
-            events, event_unix_ts = zip(*nhit_filtered)
-            if self.is_mc:
-                event_mc_assn = mc_assn_filtered
-        else:
-            events, event_unix_ts = list(), list()
-            if self.is_mc:
-                event_mc_assn = list()
+            event_mc_assn = [event_mc_assn[i] for i in event_idx]
         nevents = len(events)
+        event_lengths = event_nhit[event_idx]
 
         # write event to file
         raw_event_array = np.zeros((nevents,), dtype=self.raw_event_dtype)
         raw_event_slice = self.data_manager.reserve_data(self.raw_event_dset_name, nevents)
         raw_event_idcs = np.arange(raw_event_slice.start, raw_event_slice.stop, dtype=int)
         if nevents:
-            raw_event_array['unix_ts'] = [p[0]['timestamp'] for p in event_unix_ts]
+            raw_event_array['unix_ts'] = np.array([ts[0] for ts in event_unix_ts], dtype=self.packets_dtype)['timestamp']
             raw_event_array['id'] = raw_event_idcs
         self.data_manager.write_data(self.raw_event_dset_name, raw_event_slice, raw_event_array)
 
         # write packets to file
-        packets_array = np.concatenate(events, axis=0) if nevents else np.empty((0,), dtype=self.packets_dtype)
+        packets_array = np.empty((event_lengths.sum(),), dtype=self.packets_dtype)
+        if nevents:
+            np.concatenate(events, axis=0, out=packets_array)
         packets_slice = self.data_manager.reserve_data(self.packets_dset_name, len(packets_array))
         packets_idcs = np.arange(packets_slice.start, packets_slice.stop)
         self.data_manager.write_data(self.packets_dset_name, packets_slice, packets_array)
 
         # set up references
         #   event -> packet refs
-        ev_idcs = np.concatenate([np.full(len(ev), i_ev) for i_ev, ev in zip(raw_event_idcs, events)], axis=0) \
-            if len(events) else np.empty(0, dtype=raw_event_idcs.dtype)
+        ev_idcs = np.repeat(raw_event_idcs, event_lengths)
         ref = np.c_[ev_idcs, packets_idcs]
         self.data_manager.write_ref(self.raw_event_dset_name, self.packets_dset_name, ref)
 
@@ -444,8 +479,9 @@ class RawEventGenerator(H5FlowGenerator):
         if self.rank == self.size - 1:
             self.comm.send(self.last_unix_ts, dest=0)
         # rank i give max unix timestamp to i+1
-        mask = packets['packet_type'] == 4
-        max_unix_ts = packets[mask][np.argmax(packets[mask]['timestamp'])] if np.any(mask) else self.last_unix_ts
+        unix_ts_idx = np.flatnonzero(packets['packet_type'] == 4)
+        max_unix_ts = (packets[unix_ts_idx[np.argmax(packets['timestamp'][unix_ts_idx])]]
+                       if len(unix_ts_idx) else self.last_unix_ts)
         self.last_unix_ts = self.comm.recv(source=self.rank - 1 if self.rank > 0 else self.size - 1)
         # rank N-1 store max unix timestamp for next iteration
         if self.rank != self.size - 1:
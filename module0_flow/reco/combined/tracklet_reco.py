@@ -1,9 +1,6 @@
 import numpy as np
 import numpy.ma as ma
-
-import sklearn.cluster as cluster
-import sklearn.decomposition as dcomp
-from skimage.measure import LineModelND, ransac
+import numba
 
 from h5flow.core import H5FlowStage, resources
 
@@ -104,8 +101,6 @@ class TrackletReconstruction(H5FlowStage):
         self.trajectory_dx = params.get('trajectory_dx', self.default_trajectory_dx)
         self.tracklet_dtype = self.tracklet_dtype(self.trajectory_pts)
 
-        self.dbscan = cluster.DBSCAN(eps=self._dbscan_eps, min_samples=self._dbscan_min_samples)
-
     def init(self, source_name):
         super(TrackletReconstruction, self).init(source_name)
 
@@ -142,101 +137,73 @@ class TrackletReconstruction(H5FlowStage):
             hit_drift = ma.array(hit_drift, mask=(events['nhit'][..., np.newaxis] > self.max_nhit) | hits['id'].mask,
                                  shrink=False)
 
-        track_ids = self.find_tracks(hits, hit_drift['z'])
-        tracks = self.calc_tracks(hits, hit_drift['z'], track_ids, self.trajectory_pts,
-                                  self.trajectory_dx)
-        n_tracks = np.count_nonzero(~tracks['id'].mask)
-        tracks_mask = ~tracks['id'].mask
+        xyz = self.hit_xyz(hits, hit_drift['z'])
+        track_ids = self.find_tracks(hits, xyz)
+        tracks, track_ev, track_label = self.calc_flat_tracks(
+            hits, xyz, track_ids, self.trajectory_pts, self.trajectory_dx)
 
-        tracks_slice = self.data_manager.reserve_data(self.tracklet_dset_name, n_tracks)
-        np.place(tracks['id'], tracks_mask, np.r_[tracks_slice].astype('u4'))
-        self.data_manager.write_data(self.tracklet_dset_name, tracks_slice, tracks[tracks_mask])
+        tracks_slice = self.data_manager.reserve_data(self.tracklet_dset_name, len(tracks))
+        tracks['id'] = np.arange(tracks_slice.start, tracks_slice.stop, dtype='u4')
+        self.data_manager.write_data(self.tracklet_dset_name, tracks_slice, tracks)
 
         # track -> hit ref
-        track_ref_id = np.take_along_axis(tracks['id'], track_ids, axis=-1)
-        mask = (~track_ref_id.mask) & (track_ids != -1) & (~hits['id'].mask)
-        ref = np.c_[track_ref_id[mask], hits['id'][mask]]
+        hit_track_ids = track_ids.filled(-1)
+        # last column is never filled, so that hits with no track (-1) map to no track
+        track_idx = np.full((len(hits), hit_track_ids.max(initial=-1) + 2), -1)
+        track_idx[track_ev, track_label] = np.arange(len(tracks))
+        hit_track_idx = np.take_along_axis(track_idx, hit_track_ids, axis=-1)
+        mask = (hit_track_idx != -1) & (~ma.getmaskarray(hits['id']))
+        ref = np.c_[tracks['id'][hit_track_idx[mask]], hits['id'][mask]]
         self.data_manager.write_ref(self.tracklet_dset_name, self.hits_dset_name, ref)
 
         # event -> track ref
-        ev_id = np.broadcast_to(np.expand_dims(np.r_[source_slice], axis=-1), tracks.shape)
-        ref = np.c_[ev_id[tracks_mask], tracks['id'][tracks_mask]]
+        ref = np.column_stack((source_slice.start + track_ev, tracks['id']))
         self.data_manager.write_ref(source_name, self.tracklet_dset_name, ref)
 
     @staticmethod
     def hit_xyz(hits, hit_z):
-        xyz = np.concatenate((
-            np.expand_dims(hits['px'], axis=-1),
-            np.expand_dims(hits['py'], axis=-1),
-            np.expand_dims(hit_z, axis=-1),
-        ), axis=-1)
-        return xyz
-
-    def find_tracks(self, hits, hit_z):
         '''
-            Extract tracks from a given hits array
-
             :param hits: masked array ``shape: (N, n)``
 
             :param hit_z: masked array ``shape: (N, n)``
 
-            :returns: mask array ``shape: (N, n)`` of track ids for each hit, a value of -1 means no track is associated with the hit
+            :returns: array ``shape: (N, n, 3)`` of hit 3D positions, values at masked hits are undefined
         '''
-        xyz = self.hit_xyz(hits, hit_z)
-
-        iter_mask = np.ones(hits.shape, dtype=bool)
-        iter_mask = iter_mask & (~hits['id'].mask)
-        track_id = np.full(hits.shape, -1, dtype='i8')
-        for i in range(hits.shape[0]):
-
-            if not np.any(iter_mask[i]):
-                continue
-
-            current_track_id = -1
-
-            for _ in range(self.max_iterations):
-                # dbscan to find clusters
-                track_ids = self._do_dbscan(xyz[i], iter_mask[i])
-
-                for id_ in np.unique(track_ids):
-                    if id_ == -1:
-                        continue
-                    mask = track_ids == id_
-                    if np.sum(mask) <= self._ransac_min_samples:
-                        continue
-
-                    # ransac for collinear hits
-                    inliers = self._do_ransac(xyz[i], mask)
-                    mask[mask] = inliers
+        xyz = np.empty(hits.shape + (3,), dtype='f8')
+        xyz[..., 0] = ma.getdata(hits['px'])
+        xyz[..., 1] = ma.getdata(hits['py'])
+        xyz[..., 2] = ma.getdata(hit_z)
+        return xyz
 
-                    if np.sum(mask) < 1:
-                        continue
+    def find_tracks(self, hits, xyz):
+        '''
+            Extract tracks from a given hits array
 
-                    # and a final dbscan for re-clustering
-                    final_track_ids = self._do_dbscan(xyz[i], mask)
+            :param hits: masked array ``shape: (N, n)``
 
-                    for id_ in np.unique(final_track_ids):
-                        if id_ == -1:
-                            continue
-                        mask = final_track_ids == id_
+            :param xyz: array ``shape: (N, n, 3)``, see ``hit_xyz()``
 
-                        current_track_id += 1
-                        track_id[i, mask] = current_track_id
-                        iter_mask[i, mask] = False
+            :returns: mask array ``shape: (N, n)`` of track ids for each hit, a value of -1 means no track is associated with the hit
+        '''
+        valid = ~ma.getmaskarray(hits['id'])
 
-                if np.all(track_ids == -1) or not np.any(iter_mask[i]):
-                    break
+        track_id = _find_tracks_numba(xyz, valid,
+                                      self._dbscan_eps, self._dbscan_min_samples,
+                                      self._ransac_min_samples,
+                                      self._ransac_residual_threshold,
+                                      self._ransac_max_trials,
+                                      self.max_iterations)
 
         return ma.array(track_id, mask=hits['id'].mask, shrink=False)
 
     @classmethod
-    def calc_tracks(cls, hits, hit_z, track_ids, trajectory_pts, trajectory_dx):
+    def calc_tracks(cls, hits, xyz, track_ids, trajectory_pts, trajectory_dx):
         '''
             Calculate track parameters from hits
 
             :param hits: masked array, ``shape: (N,M)``
 
-            :param hit_z: masked array, ``shape: (N,M)``
+            :param xyz: array, ``shape: (N,M,3)``, see ``hit_xyz()``
 
             :param track_ids: masked array, ``shape: (N,M)``
 
@@ -246,88 +213,99 @@ class TrackletReconstruction(H5FlowStage):
 
             :returns: masked array, ``shape: (N,m)``
         '''
-        xyz = cls.hit_xyz(hits, hit_z)
+        flat_tracks, track_ev, track_label = cls.calc_flat_tracks(
+            hits, xyz, track_ids, trajectory_pts, trajectory_dx)
 
         n_tracks = np.clip(track_ids.max() + 1, 1, np.inf).astype(int) if np.count_nonzero(~track_ids.mask) \
             else 1
-        tracks = np.empty((len(hits), n_tracks), dtype=cls.tracklet_dtype(trajectory_pts))
+        tracks = np.empty((len(hits), n_tracks), dtype=flat_tracks.dtype)
         tracks_mask = np.ones(tracks.shape, dtype=bool)
-        for i in range(tracks.shape[0]):
-            for j in range(tracks.shape[1]):
-                mask = ((track_ids[i] == j) & (~track_ids.mask[i])
-                        & (~hits['id'].mask[i]))
-                if np.count_nonzero(mask) < 2:
-                    continue
-
-                # PCA on central hits
-                centroid, axis = cls.do_pca(xyz[i], mask)
-                r_min, r_max = cls.projected_limits(
-                    centroid, axis, xyz[i][mask])
-                residual = cls.track_residual(centroid, axis, xyz[i][mask])
-                xyp = cls.xyp(axis, centroid)
-
-                # run trajectory approximation algo
-                traj = cls.trajectory_approx(centroid, axis, xyz[i][mask],
-                                             npts=trajectory_pts, dx=trajectory_dx,
-                                             weights=hits[i][mask]['q'])  # (npts, 3)
-                d = cls.trajectory_residual(xyz[i][mask], traj)  # (npts-1, N)
-                min_edge_mask = np.indices(d.shape)[0] != np.expand_dims(np.argmin(d, axis=0), 0)  # (npts-1, N)
-                edge_q = ma.sum(ma.array(
-                    np.broadcast_to(hits[i][mask]['q'][np.newaxis, :],
-                                    min_edge_mask.shape),
-                    mask=min_edge_mask, shrink=False), axis=-1)  # (npts-1,)
-                edge_res = ma.mean(ma.array(d, mask=min_edge_mask,
-                                            shrink=False), axis=-1)  # (npts-1,)
-
-                tracks[i, j]['theta'] = cls.theta(axis)
-                tracks[i, j]['phi'] = cls.phi(axis)
-                tracks[i, j]['xp'] = xyp[0]
-                tracks[i, j]['yp'] = xyp[1]
-                tracks[i, j]['nhit'] = np.count_nonzero(mask)
-                tracks[i, j]['q'] = np.sum(hits[i][mask]['q'])
-                tracks[i, j]['ts_start'] = np.min(hits[i][mask]['ts'])
-                tracks[i, j]['ts_end'] = np.max(hits[i][mask]['ts'])
-                tracks[i, j]['residual'] = residual
-                tracks[i, j]['length'] = np.linalg.norm(r_max - r_min)
-                tracks[i, j]['start'] = r_min
-                tracks[i, j]['end'] = r_max
-
-                tracks[i, j]['trajectory'] = traj
-                tracks[i, j]['trajectory_residual'] = edge_res
-                tracks[i, j]['dx'] = np.diff(traj, axis=0)
-                tracks[i, j]['dq'] = edge_q
-                tracks[i, j]['dn'] = np.sum(~min_edge_mask, axis=-1)
-
-                tracks_mask[i, j] = False
+        tracks[track_ev, track_label] = flat_tracks
+        tracks_mask[track_ev, track_label] = False
 
         return ma.array(tracks, mask=tracks_mask, shrink=False)
 
-    def _do_dbscan(self, xyz, mask):
+    @classmethod
+    def calc_flat_tracks(cls, hits, xyz, track_ids, trajectory_pts, trajectory_dx):
         '''
-            :param xyz: ``shape: (N,3)`` array of precomputed 3D distances
+            Calculate track parameters from hits, only allocating the tracks
+            that exist
 
-            :param mask: ``shape: (N,)`` boolean array of valid positions (``True == valid``)
+            :param hits: masked array, ``shape: (N,M)``
 
-            :returns: ``shape: (N,)`` array of grouped track ids
-        '''
-        clustering = self.dbscan.fit(xyz[mask])
-        track_ids = np.full(len(mask), -1)
-        track_ids[mask] = clustering.labels_
-        return track_ids
+            :param xyz: array, ``shape: (N,M,3)``, see ``hit_xyz()``
 
-    def _do_ransac(self, xyz, mask):
-        '''
-            :param xyz: ``shape: (N,3)`` array of 3D positions
+            :param track_ids: masked array, ``shape: (N,M)``
 
-            :param mask: ``shape: (N,)`` boolean array of valid positions (``True == valid``)
+            :param trajectory_pts: int
 
-            :returns: ``shape: (N,)`` boolean array of colinear positions
+            :param trajectory_dx: float
+
+            :returns: ``tuple`` of tracks ``shape: (n,)``, event index of each track ``shape: (n,)``, and track id of each track ``shape: (n,)``
         '''
-        model_robust, inliers = ransac(xyz[mask], LineModelND,
-                                       min_samples=self._ransac_min_samples,
-                                       residual_threshold=self._ransac_residual_threshold,
-                                       max_trials=self._ransac_max_trials)
-        return inliers
+        q = np.ascontiguousarray(ma.getdata(hits['q']))
+        ts = np.ascontiguousarray(ma.getdata(hits['ts']))
+
+        # group hits by event and track id
+        hit_mask = ((~ma.getmaskarray(track_ids)) & (~ma.getmaskarray(hits['id']))
+                    & (ma.getdata(track_ids) != -1))
+        hit_ev, hit_idx = np.nonzero(hit_mask)
+        hit_track_ids = ma.getdata(track_ids)[hit_ev, hit_idx]
+        n_ids = hit_track_ids.max(initial=-1) + 1
+        hit_key = hit_ev * n_ids + hit_track_ids
+        order = np.argsort(hit_key, kind='stable')
+        hit_idx = hit_idx[order]
+
+        # only keep tracks with at least 2 hits
+        nhit = np.bincount(hit_key)
+        track_key = np.flatnonzero(nhit >= 2)
+        track_ev, track_label = np.divmod(track_key, max(n_ids, 1))
+        track_start = np.searchsorted(hit_key[order], track_key)
+
+        tracks = np.empty(len(track_key), dtype=cls.tracklet_dtype(trajectory_pts))
+        for k, (i, start) in enumerate(zip(track_ev, track_start)):
+            idx = hit_idx[start:start + nhit[track_key[k]]]
+            track_xyz = xyz[i, idx]
+            track_q = q[i, idx]
+            track_ts = ts[i, idx]
+
+            # PCA on central hits
+            centroid, axis, r_min, r_max, residual, theta, phi, xyp = cls.fit_track(
+                track_xyz)
+
+            # run trajectory approximation algo
+            traj = cls.trajectory_approx(centroid, axis, track_xyz,
+                                         npts=trajectory_pts, dx=trajectory_dx,
+                                         weights=track_q)  # (npts, 3)
+            d = cls.trajectory_residual(track_xyz, traj)  # (npts-1, N)
+            min_edge_mask = np.indices(d.shape)[0] != np.expand_dims(np.argmin(d, axis=0), 0)  # (npts-1, N)
+            edge_q = ma.sum(ma.array(
+                np.broadcast_to(track_q[np.newaxis, :],
+                                min_edge_mask.shape),
+                mask=min_edge_mask, shrink=False), axis=-1)  # (npts-1,)
+            edge_res = ma.mean(ma.array(d, mask=min_edge_mask,
+                                        shrink=False), axis=-1)  # (npts-1,)
+
+            tracks[k]['theta'] = theta
+            tracks[k]['phi'] = phi
+            tracks[k]['xp'] = xyp[0]
+            tracks[k]['yp'] = xyp[1]
+            tracks[k]['nhit'] = len(idx)
+            tracks[k]['q'] = track_q.sum()
+            tracks[k]['ts_start'] = track_ts.min()
+            tracks[k]['ts_end'] = track_ts.max()
+            tracks[k]['residual'] = residual
+            tracks[k]['length'] = np.linalg.norm(r_max - r_min)
+            tracks[k]['start'] = r_min
+            tracks[k]['end'] = r_max
+
+            tracks[k]['trajectory'] = traj
+            tracks[k]['trajectory_residual'] = edge_res
+            tracks[k]['dx'] = np.diff(traj, axis=0)
+            tracks[k]['dq'] = edge_q
+            tracks[k]['dn'] = np.sum(~min_edge_mask, axis=-1)
+
+        return tracks, track_ev, track_label
 
     @staticmethod
     def trajectory_approx(centroid, axis, xyz, npts, dx, weights=None):
@@ -403,36 +381,46 @@ class TrackletReconstruction(H5FlowStage):
         return traj
 
     @staticmethod
-    def do_pca(xyz, mask):
+    def fit_track(xyz):
         '''
-            :param xyz: ``shape: (N,3)`` array of 3D positions
+            Fit a line to 3D positions using the principal axis of the
+            positions' covariance matrix
 
-            :param mask: ``shape: (N,)`` boolean array of valid positions (``True == valid``)
+            :param xyz: ``shape: (N,3)`` array of 3D positions
 
-            :returns: ``tuple`` of ``shape: (3,)``, ``shape: (3,)`` of centroid and central axis
+            :returns: ``tuple`` of centroid ``shape: (3,)``, central axis ``shape: (3,)``, start point ``shape: (3,)``, end point ``shape: (3,)``, average fit error ``shape: (3,)``, theta, phi, and x,y coordinate where line intersects ``x=0,y=0`` plane ``shape: (2,)``
         '''
-        centroid = np.mean(xyz[mask], axis=0)
-        pca = dcomp.PCA(n_components=1).fit(xyz[mask] - centroid)
-        axis = pca.components_[0] / np.linalg.norm(pca.components_[0])
+        centroid = np.mean(xyz, axis=0)
+        x = xyz - centroid
+
+        # PCA axis is eigenvector of largest eigenvalue of 3x3 covariance
+        _, v = np.linalg.eigh(x.T @ x)
+        axis = v[:, -1]
 
         # break degenerate pca axis direction by fixing y component to be negative
         if axis[1] > 0:
             axis = -axis
-        return centroid, axis
 
-    @staticmethod
-    def projected_limits(centroid, axis, xyz):
-        s = np.dot((xyz - centroid), axis)
+        # projected limits
+        s = x @ axis
         xyz_min, xyz_max = np.amin(xyz, axis=0), np.amax(xyz, axis=0)
         r_max = np.clip(centroid + axis * np.max(s), xyz_min, xyz_max)
         r_min = np.clip(centroid + axis * np.min(s), xyz_min, xyz_max)
-        return r_min, r_max
 
-    @staticmethod
-    def track_residual(centroid, axis, xyz):
-        s = np.dot((xyz - centroid), axis)
-        res = np.abs(xyz - (centroid + np.outer(s, axis)))
-        return np.mean(res, axis=0)
+        # track residual
+        residual = np.mean(np.abs(x - np.outer(s, axis)), axis=0)
+
+        # angle w.r.t z-axis and orientation about z-axis
+        theta = np.arctan2(np.linalg.norm(axis[:2]), axis[-1])
+        phi = np.arctan2(axis[1], axis[0])
+
+        # intersection with z=0 plane
+        if axis[-1] == 0:
+            xyp = centroid[:2]
+        else:
+            xyp = (centroid - axis * centroid[-1] / axis[-1])[:2]
+
+        return centroid, axis, r_min, r_max, residual, theta, phi, xyp
 
     @staticmethod
     def trajectory_residual(xyz, traj):
@@ -458,34 +446,222 @@ class TrackletReconstruction(H5FlowStage):
                                           np.linalg.norm(d1, axis=-1))[non_overlap_mask]
         return dt
 
-    @staticmethod
-    def theta(axis):
-        '''
-            :param axis: array, ``shape: (3,)``
 
-            :returns: angle of axis w.r.t z-axis
-        '''
-        return np.arctan2(np.linalg.norm(axis[:2]), axis[-1])
+@numba.njit(cache=True)
+def _dbscan(xyz, mask, eps, min_samples):
+    '''
+        DBSCAN clustering of the ``mask``-ed points using a brute-force
+        neighbor search (events are small enough that a tree is not needed).
+        Cluster labels are assigned in the same order as
+        ``sklearn.cluster.DBSCAN``.
 
-    @staticmethod
-    def phi(axis):
-        '''
-            :param axis: array, ``shape: (3,)``
+        :param xyz: ``shape: (N,3)`` array of 3D positions
 
-            :returns: orientation of axis about z-axis
-        '''
-        return np.arctan2(axis[1], axis[0])
+        :param mask: ``shape: (N,)`` boolean array of valid positions (``True == valid``)
 
-    @staticmethod
-    def xyp(axis, centroid):
-        '''
-            :param axis: array, ``shape: (3,)``
+        :returns: ``shape: (N,)`` array of grouped track ids, ``-1`` for noise or invalid positions
+    '''
+    n = len(mask)
+    eps2 = eps * eps
+    labels = np.full(n, -1, dtype=np.int64)
+
+    n_neighbors = np.zeros(n, dtype=np.int64)
+    for i in range(n):
+        if not mask[i]:
+            continue
+        for j in range(n):
+            if not mask[j]:
+                continue
+            d2 = ((xyz[i, 0] - xyz[j, 0]) ** 2 + (xyz[i, 1] - xyz[j, 1]) ** 2
+                  + (xyz[i, 2] - xyz[j, 2]) ** 2)
+            if d2 <= eps2:
+                n_neighbors[i] += 1
+    is_core = n_neighbors >= min_samples
+
+    stack = np.empty(n, dtype=np.int64)
+    label = 0
+    for i in range(n):
+        if labels[i] != -1 or not is_core[i]:
+            continue
+
+        # expand cluster from core point
+        labels[i] = label
+        stack[0] = i
+        n_stack = 1
+        while n_stack > 0:
+            n_stack -= 1
+            k = stack[n_stack]
+            if not is_core[k]:
+                continue
+            for j in range(n):
+                if not mask[j] or labels[j] != -1:
+                    continue
+                d2 = ((xyz[k, 0] - xyz[j, 0]) ** 2 + (xyz[k, 1] - xyz[j, 1]) ** 2
+                      + (xyz[k, 2] - xyz[j, 2]) ** 2)
+                if d2 <= eps2:
+                    labels[j] = label
+                    stack[n_stack] = j
+                    n_stack += 1
+        label += 1
+    return labels
+
+
+@numba.njit(cache=True)
+def _ransac_line(xyz, residual_threshold, samples):
+    '''
+        RANSAC fit of a 3D line, trial lines are constructed from two randomly
+        sampled points.
 
-            :param centroid: array, ``shape: (3,)``
+        :param xyz: ``shape: (N,3)`` array of 3D positions
 
-            :returns: x,y coordinate where line intersects ``x=0,y=0`` plane
-        '''
-        if axis[-1] == 0:
-            return centroid[:2]
-        s = -centroid[-1] / axis[-1]
-        return (centroid + axis * s)[:2]
+        :param samples: ``shape: (max_trials,2)`` integer buffer to hold the sampled position indices, one trial per row
+
+        :returns: ``shape: (N,)`` boolean array of colinear positions
+    '''
+    n = len(xyz)
+    if n < 2:
+        return np.zeros(n, dtype=np.bool_)
+
+    max_trials = len(samples)
+    for k in range(max_trials):
+        samples[k, 0] = np.random.randint(0, n)
+        samples[k, 1] = np.random.randint(0, n - 1)
+        if samples[k, 1] >= samples[k, 0]:
+            samples[k, 1] += 1
+
+    best_trial = -1
+    best_n_inliers = 0
+    best_residual_sum = np.inf
+    for k in range(max_trials):
+        n_inliers, residual_sum = _line_inliers(xyz, samples[k, 0], samples[k, 1],
+                                                residual_threshold, None)
+        if (n_inliers > best_n_inliers
+                or (n_inliers == best_n_inliers and residual_sum < best_residual_sum)):
+            best_trial = k
+            best_n_inliers = n_inliers
+            best_residual_sum = residual_sum
+
+    best_inliers = np.zeros(n, dtype=np.bool_)
+    if best_trial >= 0:
+        _line_inliers(xyz, samples[best_trial, 0], samples[best_trial, 1],
+                      residual_threshold, best_inliers)
+    return best_inliers
+
+
+@numba.njit(cache=True)
+def _line_inliers(xyz, i0, i1, residual_threshold, inliers):
+    '''
+        Count positions within ``residual_threshold`` of the line through
+        ``xyz[i0]`` and ``xyz[i1]``
+
+        :param inliers: ``shape: (N,)`` boolean array to fill with the inlier positions, or ``None``
+
+        :returns: ``tuple`` of number of inliers and sum of inlier residuals (``0`` inliers for a degenerate line)
+    '''
+    dx = xyz[i1, 0] - xyz[i0, 0]
+    dy = xyz[i1, 1] - xyz[i0, 1]
+    dz = xyz[i1, 2] - xyz[i0, 2]
+    norm = np.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
+    if norm == 0:
+        # degenerate trial
+        return 0, np.inf
+    dx, dy, dz = dx / norm, dy / norm, dz / norm
+
+    # perpendicular distance to trial line
+    n_inliers = 0
+    residual_sum = 0.
+    for j in range(len(xyz)):
+        rx = xyz[j, 0] - xyz[i0, 0]
+        ry = xyz[j, 1] - xyz[i0, 1]
+        rz = xyz[j, 2] - xyz[i0, 2]
+        cx = ry * dz - rz * dy
+        cy = rz * dx - rx * dz
+        cz = rx * dy - ry * dx
+        r = np.sqrt(cx ** 2 + cy ** 2 + cz ** 2)
+        if r < residual_threshold:
+            n_inliers += 1
+            residual_sum += r
+            if inliers is not None:
+                inliers[j] = True
+    return n_inliers, residual_sum
+
+
+@numba.njit(cache=True)
+def _group_labels(labels):
+    '''
+        Group positions by label
+
+        :param labels: ``shape: (N,)`` array of labels, ``-1`` for no label
+
+        :returns: ``tuple`` of position indices sorted by label ``shape: (N,)`` and label boundaries ``shape: (n_labels+1,)``, such that the positions with label ``k`` are ``order[bounds[k]:bounds[k+1]]``
+    '''
+    # counting sort, labels are small non-negative integers (or -1)
+    counts = np.bincount(labels + 1)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+
+    order = np.empty(len(labels), dtype=np.int64)
+    pos = offsets[:-1].copy()
+    for i in range(len(labels)):
+        order[pos[labels[i] + 1]] = i
+        pos[labels[i] + 1] += 1
+    return order, offsets[1:]
+
+
+@numba.njit(cache=True, parallel=True)
+def _find_tracks_numba(xyz, valid, dbscan_eps, dbscan_min_samples,
+                       ransac_min_samples, ransac_residual_threshold,
+                       ransac_max_trials, max_iterations):
+    '''
+        Iterative DBSCAN + RANSAC track finding, run in parallel over events.
+
+        :param xyz: ``shape: (N,M,3)`` array of 3D positions
+
+        :param valid: ``shape: (N,M)`` boolean array of valid positions (``True == valid``)
+
+        :returns: ``shape: (N,M)`` array of track ids for each hit, ``-1`` for no track
+    '''
+    track_id = np.full(valid.shape, -1, dtype=np.int64)
+    for i in numba.prange(xyz.shape[0]):
+        iter_mask = valid[i].copy()
+        if not np.any(iter_mask):
+            continue
+
+        inlier_mask = np.zeros(len(iter_mask), dtype=np.bool_)
+        ransac_samples = np.empty((ransac_max_trials, 2), dtype=np.int64)
+
+        current_track_id = -1
+        for _ in range(max_iterations):
+            # dbscan to find clusters
+            track_ids = _dbscan(xyz[i], iter_mask, dbscan_eps, dbscan_min_samples)
+            order, bounds = _group_labels(track_ids)
+
+            # only clusters large enough to fit
+            for id_ in np.flatnonzero(np.diff(bounds) > ransac_min_samples):
+                idx = order[bounds[id_]:bounds[id_ + 1]]
+
+                # ransac for collinear hits
+                inliers = _ransac_line(xyz[i][idx], ransac_residual_threshold,
+                                       ransac_samples)
+                inlier_idx = idx[inliers]
+
+                if len(inlier_idx) < 1:
+                    continue
+
+                # and a final dbscan for re-clustering
+                inlier_mask[inlier_idx] = True
+                final_track_ids = _dbscan(xyz[i], inlier_mask, dbscan_eps, dbscan_min_samples)
+                inlier_mask[inlier_idx] = False
+                final_order, final_bounds = _group_labels(final_track_ids)
+
+                for final_id in range(len(final_bounds) - 1):
+                    final_idx = final_order[final_bounds[final_id]:final_bounds[final_id + 1]]
+
+                    current_track_id += 1
+                    track_id[i][final_idx] = current_track_id
+                    iter_mask[final_idx] = False
+
+            if len(bounds) == 1 or not np.any(iter_mask):
+                break
+
+    return track_id